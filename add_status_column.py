@@ -1,129 +1,266 @@
 import pandas as pd
+import numpy as np
 import sqlite3
 import os
+import shutil
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
 
 DB_NAME = "production.db"
+TRANSITIONS_TABLE = "status_transitions"
 
-def add_status_column():
-    print(f"Connecting to {DB_NAME}...")
-    conn = sqlite3.connect(DB_NAME)
-    
-    print("Reading data into DataFrame...")
-    # Read necessary columns + sorting columns
-    # We need everything to write back the full table with the new column
-    df = pd.read_sql("SELECT * FROM production_data", conn)
-    conn.close()
-    
-    print(f"Loaded {len(df)} rows. Sorting...")
+# Wells are independent, so the table is split into ranges of file_no and each
+# range is processed by its own worker. More partitions than cores keeps each
+# worker's DataFrame (and therefore peak memory) small.
+NUM_PARTITIONS = 64
+NUM_WORKERS = os.cpu_count() or 1
+
+def differs_from_previous(s):
+    """True where a value differs from the row above, treating two NULLs as equal."""
+    prev = s.shift()
+    changed = (s != prev) & ~(s.isna() & prev.isna())
+    # The first row always starts a new run
+    if len(changed):
+        changed.iloc[0] = True
+    return changed
+
+def build_transitions(df):
+    """
+    Collapse the per-row statuses into one row per status change.
+    Expects df sorted by file_no, pool, date with 'status' already assigned.
+    run_length is the number of months the well spent in from_status.
+    """
+    # A new well starts wherever file_no or pool differs from the previous row
+    new_well = differs_from_previous(df['file_no']) | differs_from_previous(df['pool'])
+    status_change = df['status'] != df['status'].shift()
+
+    # Label each consecutive run of the same status, then measure it
+    run_id = (new_well | status_change).cumsum()
+    run_length = run_id.map(run_id.value_counts())
+
+    transitions = pd.DataFrame({
+        'file_no': df['file_no'],
+        'api_no': df['api_no'],
+        'pool': df['pool'],
+        'date': df['date'],
+        'from_status': df['status'].shift(),
+        'to_status': df['status'],
+        'run_length': run_length.shift(),
+    })
+
+    # The first row of each well has no previous status to transition from
+    transitions = transitions[status_change & ~new_well]
+    transitions['run_length'] = transitions['run_length'].astype(int)
+    return transitions
+
+def create_indices(cursor):
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_api_no ON production_data (api_no)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_date ON production_data (date)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_file_no ON production_data (file_no)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_status ON production_data (status)")
+    # Index the new flags for efficient analytics
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_np1m ON production_data (no_prod_1m)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_np2m ON production_data (no_prod_2m)")
+
+    cursor.execute(f"CREATE INDEX IF NOT EXISTS idx_tr_date ON {TRANSITIONS_TABLE} (date)")
+    cursor.execute(f"CREATE INDEX IF NOT EXISTS idx_tr_pool_date ON {TRANSITIONS_TABLE} (pool, date)")
+    cursor.execute(f"CREATE INDEX IF NOT EXISTS idx_tr_well ON {TRANSITIONS_TABLE} (file_no, pool)")
+    cursor.execute(f"CREATE INDEX IF NOT EXISTS idx_tr_to_status ON {TRANSITIONS_TABLE} (to_status)")
+
+def compute_status(df):
+    """Assign status and no-production flags to a frame holding whole wells."""
     df['date'] = pd.to_datetime(df['date'])
     df.sort_values(by=['file_no', 'pool', 'date'], inplace=True)
-    
-    print("Calculating Status (this may take a moment)...")
-
-    def apply_status_logic(group):
-        # Rolling checks for zero production
-        # rolling().sum() == window_size implies all in window are 0 (since we check == 0)
-        is_zero_prod = (group['bbls_oil'] == 0).astype(int)
-        
-        no_prod_1m = is_zero_prod.rolling(window=1).sum() == 1
-        no_prod_2m = is_zero_prod.rolling(window=2).sum() == 2
-        no_prod_3m = is_zero_prod.rolling(window=3).sum() == 3
-        no_prod_6m = is_zero_prod.rolling(window=6).sum() == 6
-        
-        is_active = group['bbls_oil'] > 0
-        
-        # We can assign directly to the group slices
-        # Default status
-        group['status'] = 'Unknown'
-        
-        # Apply logic in order (later overwrites earlier)
-        group.loc[no_prod_1m, 'status'] = 'IA 1 - A'
-        group.loc[no_prod_2m, 'status'] = 'IA 2 - A'
-        group.loc[no_prod_3m, 'status'] = 'IA'
-        group.loc[no_prod_6m, 'status'] = 'AB'
-        group.loc[is_active, 'status'] = 'A'
-        
-        return group
-
-    # GroupBy apply is flexible but can be slow on 3M rows. 
-    # Optimization: Vectorized operations on the whole sorted dataframe with checks for group boundaries.
-    # However, pandas rolling supports 'groupby' efficiently in newer versions.
-    # Let's try the direct groupby-apply on small function or transform.
+
+    # GroupBy apply is flexible but can be slow on 3M rows.
     # Groupby.apply might be too slow for 3M rows if groups are small (many wells).
-    # Faster approach: calculates rolling on whole DF, then mask out where FileNo/Pool changes.
-    
-    # Let's stick to the user's logic structure but optimize if needed. 
-    # With 3M rows, a simple apply might take 5-10 mins.
     # Vectorized approach:
-    
+
     # 1. Calculate is_zero_prod global
     df['is_zero'] = (df['bbls_oil'] == 0).astype(int)
-    
+
     # 2. Groupby Rolling
     # This is efficient in modern pandas
-    g = df.groupby(['file_no', 'pool'])['is_zero']
-    
-    # We need to map the result back to the index
-    print("  - Calculating rolling windows...")
+    # dropna=False keeps rows with a NULL file_no or pool as their own well
+    # instead of silently dropping them from the rolling result
+    g = df.groupby(['file_no', 'pool'], dropna=False)['is_zero']
+
     # Calculate boolean masks
     mask_1m = g.rolling(window=1).sum().reset_index(level=[0,1], drop=True) == 1
     mask_2m = g.rolling(window=2).sum().reset_index(level=[0,1], drop=True) == 2
     mask_3m = g.rolling(window=3).sum().reset_index(level=[0,1], drop=True) == 3
     mask_6m = g.rolling(window=6).sum().reset_index(level=[0,1], drop=True) == 6
-    
+
     # Assign new persistent columns (0 or 1)
-    print("  - Assigning flag columns...")
     df['no_prod_1m'] = mask_1m.astype(int)
     df['no_prod_2m'] = mask_2m.astype(int)
 
-    print("  - Assigning statuses...")
     df['status'] = 'Unknown'
-    
+
     # Align indices (reset_index above might have messed alignment if sorting changed, but we sorted inplace)
-    # The result of groupby().rolling() return values matched the df order because we didn't drop keys in g = df.groupby...
-    # Wait, reset_index(drop=True) on the result of rolling() removes the MultiIndex (FileNo, Pool, original_index).
-    # If the original dataframe index was not monotonic increasing or had gaps, reset_index(drop=True) might align purely by position.
-    # Since we sorted `df` by FileNo, Pool, Date before grouping, and groupby preserves that order, positional alignment is safe 
-    # IF the rolling operation output one row per input row (which it does).
-    
+    # reset_index(level=[0,1], drop=True) removes the (FileNo, Pool) levels and keeps the original index,
+    # and the rolling operation outputs one row per input row, so the masks align with df by label.
+
     # Apply logic in order (later overwrites earlier)
     # We use the boolean masks directly
     df.loc[mask_1m, 'status'] = 'IA 1 - A'
     df.loc[mask_2m, 'status'] = 'IA 2 - A'
     df.loc[mask_3m, 'status'] = 'IA'
     df.loc[mask_6m, 'status'] = 'AB'
-    
-    # Active overrides all (e.g. if this month produced, it is Active, even if rolling sum says 0? 
-    # Wait, if this month produced(>0), then rolling sum of 0s cannot be == window size, 
-    # UNLESS window size is large and we look at past? 
-    # No, rolling is looking at [t-window+1, t]. If t produced, then sum of 0s is at most window-1.
-    # So 'is_active' and 'no_prod_Xm' are mutually exclusive for the calculated frame.
-    
+
+    # Active overrides all.
+    # Rolling is looking at [t-window+1, t]. If t produced, then sum of 0s is at most window-1,
+    # so 'is_active' and 'no_prod_Xm' are mutually exclusive for the calculated frame.
     # However, let's strictly follow the user logic:
     # "Immediately set Status to 'Active' if BBLS_OIL_COND > 0 for any period"
     # This implies checking the current row value.
     is_active = df['bbls_oil'] > 0
     df.loc[is_active, 'status'] = 'A'
-    
+
     # Remove helper column if any
     if 'is_zero' in df.columns:
         df.drop(columns=['is_zero'], inplace=True)
-        
-    print("Writing back to database...")
-    conn = sqlite3.connect(DB_NAME)
-    df.to_sql('production_data', conn, if_exists='replace', index=False)
-    
-    print("Re-creating indices...")
+
+    return df
+
+def plan_partitions(conn, num_partitions):
+    """
+    Split the distinct file_no values into contiguous ranges.
+    Returns a list of (low, high) bounds; (None, None) selects rows with no file_no.
+    """
+    wells = pd.read_sql("SELECT DISTINCT file_no FROM production_data ORDER BY file_no", conn)['file_no']
+
+    partitions = []
+    for chunk in np.array_split(wells.dropna().to_numpy(), num_partitions):
+        if len(chunk):
+            partitions.append((chunk[0].item(), chunk[-1].item()))
+
+    if wells.isna().any():
+        partitions.append((None, None))
+    return partitions
+
+def process_partition(db_name, bounds, out_path):
+    """Worker: read one file_no range, compute statuses and write them to out_path."""
+    low, high = bounds
+
+    conn = sqlite3.connect(db_name)
+    if low is None:
+        df = pd.read_sql("SELECT * FROM production_data WHERE file_no IS NULL", conn)
+    else:
+        df = pd.read_sql("SELECT * FROM production_data WHERE file_no >= ? AND file_no <= ?",
+                         conn, params=(low, high))
+    conn.close()
+
+    df = compute_status(df)
+    transitions = build_transitions(df)
+
+    # Each worker writes to its own file so the writes don't contend for the main DB lock
+    out = sqlite3.connect(out_path)
+    df.to_sql('production_data', out, if_exists='replace', index=False)
+    transitions.to_sql(TRANSITIONS_TABLE, out, if_exists='replace', index=False)
+    out.close()
+
+    return len(df), len(transitions)
+
+# Columns added by compute_status and the transitions table's own columns
+STATUS_COLUMNS = [('no_prod_1m', 'INTEGER'), ('no_prod_2m', 'INTEGER'), ('status', 'TEXT')]
+TRANSITION_COLUMNS = ['file_no', 'api_no', 'pool', 'date', 'from_status', 'to_status', 'run_length']
+
+def create_merge_tables(conn):
+    """
+    Create the merge targets from production_data's declared schema. Taking the types
+    from a partition instead would let pandas' guess for one small slice decide them,
+    e.g. a column that is all NULL there becomes TEXT for every partition.
+    """
+    declared = {row[1]: row[2] for row in conn.execute("PRAGMA main.table_info(production_data)")}
+
+    columns = dict(declared)
+    for name, col_type in STATUS_COLUMNS:
+        columns.setdefault(name, col_type)
+    column_defs = ", ".join(f'"{name}" {col_type}' for name, col_type in columns.items())
+    conn.execute(f"CREATE TABLE production_data_new ({column_defs})")
+
+    tr_types = {'from_status': 'TEXT', 'to_status': 'TEXT', 'run_length': 'INTEGER'}
+    tr_defs = ", ".join(f'"{name}" {declared.get(name, tr_types.get(name, ""))}' for name in TRANSITION_COLUMNS)
+    conn.execute(f"CREATE TABLE {TRANSITIONS_TABLE}_new ({tr_defs})")
+
+    return list(columns)
+
+def merge_partitions(conn, part_paths):
+    """Rebuild production_data and the transitions table from the worker outputs."""
     cursor = conn.cursor()
-    cursor.execute("CREATE INDEX IF NOT EXISTS idx_api_no ON production_data (api_no)")
-    cursor.execute("CREATE INDEX IF NOT EXISTS idx_date ON production_data (date)")
-    cursor.execute("CREATE INDEX IF NOT EXISTS idx_status ON production_data (status)")
-    # Index the new flags for efficient analytics
-    cursor.execute("CREATE INDEX IF NOT EXISTS idx_np1m ON production_data (no_prod_1m)")
-    cursor.execute("CREATE INDEX IF NOT EXISTS idx_np2m ON production_data (no_prod_2m)")
+    cursor.execute("DROP TABLE IF EXISTS production_data_new")
+    cursor.execute(f"DROP TABLE IF EXISTS {TRANSITIONS_TABLE}_new")
+    columns = create_merge_tables(conn)
+
+    # Insert by name so the partition files' column order and types don't matter
+    col_list = ", ".join(f'"{name}"' for name in columns)
+    tr_list = ", ".join(f'"{name}"' for name in TRANSITION_COLUMNS)
+    for path in part_paths:
+        cursor.execute("ATTACH DATABASE ? AS part", (path,))
+        cursor.execute(f"INSERT INTO production_data_new ({col_list}) SELECT {col_list} FROM part.production_data")
+        cursor.execute(f"INSERT INTO {TRANSITIONS_TABLE}_new ({tr_list}) SELECT {tr_list} FROM part.{TRANSITIONS_TABLE}")
+        conn.commit()
+        cursor.execute("DETACH DATABASE part")
+
+    # Swap the new tables in only once every partition has been merged.
+    # sqlite3 runs DDL in autocommit, so open the transaction explicitly to make the swap atomic.
+    cursor.execute("BEGIN")
+    try:
+        cursor.execute("DROP TABLE production_data")
+        cursor.execute("ALTER TABLE production_data_new RENAME TO production_data")
+        cursor.execute(f"DROP TABLE IF EXISTS {TRANSITIONS_TABLE}")
+        cursor.execute(f"ALTER TABLE {TRANSITIONS_TABLE}_new RENAME TO {TRANSITIONS_TABLE}")
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+
+def add_status_column(db_name=DB_NAME, num_partitions=NUM_PARTITIONS, num_workers=NUM_WORKERS):
+    print(f"Connecting to {db_name}...")
+    conn = sqlite3.connect(db_name)
+
+    # Workers select their partition by file_no range, so make sure that is indexed
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_file_no ON production_data (file_no)")
     conn.commit()
+
+    partitions = plan_partitions(conn, num_partitions)
     conn.close()
-    
+
+    if not partitions:
+        print("No rows found in production_data.")
+        return
+
+    # Partition outputs live next to the DB so the merge doesn't cross filesystems
+    work_dir = tempfile.mkdtemp(prefix="status_parts_", dir=os.path.dirname(os.path.abspath(db_name)))
+    part_paths = [os.path.join(work_dir, f"part_{i:04d}.db") for i in range(len(partitions))]
+
+    try:
+        print(f"Calculating Status over {len(partitions)} partitions with {num_workers} workers...")
+        total_rows = 0
+        total_transitions = 0
+        with ProcessPoolExecutor(max_workers=num_workers) as executor:
+            futures = [executor.submit(process_partition, db_name, bounds, path)
+                       for bounds, path in zip(partitions, part_paths)]
+            for i, future in enumerate(futures, start=1):
+                rows, transitions = future.result()
+                total_rows += rows
+                total_transitions += transitions
+                print(f"  - Partition {i}/{len(partitions)}: {rows} rows, {transitions} transitions")
+
+        print(f"Processed {total_rows} rows, {total_transitions} transitions.")
+
+        print("Writing back to database...")
+        conn = sqlite3.connect(db_name)
+        merge_partitions(conn, part_paths)
+
+        print("Re-creating indices...")
+        create_indices(conn.cursor())
+        conn.commit()
+        conn.close()
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
     print("--- Status Column Added ---")
 
 if __name__ == "__main__":
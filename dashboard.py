@@ -3,9 +3,11 @@ import sqlite3
 import pandas as pd
 import plotly.express as px
 import os
+from concurrent.futures import ThreadPoolExecutor
 import geopandas as gpd
 import folium
 from streamlit_folium import st_folium
+import spatial_join
 
 # Database Path
 DB_NAME = "production.db"
@@ -17,7 +19,7 @@ st.set_page_config(page_title="Production Dashboard", layout="wide")
 st.title("🛢️ Oil & Gas Production Dashboard")
 
 # --- Navigation ---
-page = st.sidebar.radio("Navigation", ["Production Analysis", "Map Explorer"])
+page = st.sidebar.radio("Navigation", ["Production Analysis", "Anomalies", "Map Explorer"])
 
 if page == "Production Analysis":
     # --- Data Loading ---
@@ -48,10 +50,12 @@ if page == "Production Analysis":
         return min_date, max_date, pool_list, status_list
 
     def get_chart_data(start_date, end_date, selected_pools, selected_statuses):
-        conn = sqlite3.connect(DB_NAME)
+        # Read-only connection per call, so scenarios can run side by side on separate threads
+        conn = sqlite3.connect(f"file:{DB_NAME}?mode=ro", uri=True)
         
         # Construct Query params
-        params = [start_date, end_date]
+        # Inclusive of the whole end day (dates are stored with a time component)
+        params = [start_date, f"{end_date} 23:59:59"]
         
         # Pool Clause
         pool_clause = ""
@@ -86,6 +90,57 @@ if page == "Production Analysis":
         conn.close()
         return df
 
+    def get_transition_data(start_date, end_date, selected_pools):
+        """Monthly shut-ins, reactivations and abandonments by pool from the transitions table."""
+        conn = sqlite3.connect(DB_NAME)
+
+        params = [start_date, end_date]
+
+        pool_clause = ""
+        if selected_pools:
+            placeholders = ",".join("?" * len(selected_pools))
+            pool_clause = f"AND pool IN ({placeholders})"
+            params.extend(selected_pools)
+
+        # Shut-in: A -> any inactive status. Reactivation: any status -> A. Abandonment: -> AB
+        query = f"""
+        SELECT 
+            strftime('%Y-%m', date) as month,
+            pool,
+            SUM(CASE WHEN from_status = 'A' AND to_status != 'Unknown' THEN 1 ELSE 0 END) as shut_ins,
+            SUM(CASE WHEN to_status = 'A' AND from_status != 'Unknown' THEN 1 ELSE 0 END) as reactivations,
+            SUM(CASE WHEN to_status = 'AB' THEN 1 ELSE 0 END) as abandonments
+        FROM status_transitions
+        WHERE date >= ? AND date <= ?
+        {pool_clause}
+        GROUP BY 1, 2
+        ORDER BY 1
+        """
+
+        try:
+            df = pd.read_sql(query, conn, params=params)
+        except (pd.errors.DatabaseError, sqlite3.OperationalError):
+            # Table is created by add_status_column.py
+            df = None
+        finally:
+            conn.close()
+        return df
+
+    def get_comparison_data(scenarios):
+        """Run every scenario's aggregation concurrently and tag the rows with the scenario name."""
+        with ThreadPoolExecutor(max_workers=len(scenarios)) as executor:
+            futures = [
+                (s['name'], executor.submit(get_chart_data, s['start_date'], s['end_date'], s['pools'], s['statuses']))
+                for s in scenarios
+            ]
+            frames = []
+            for name, future in futures:
+                df = future.result()
+                df['scenario'] = name
+                frames.append(df)
+
+        return pd.concat(frames, ignore_index=True)
+
     # Initialize Metadata
     min_date, max_date, pool_options, status_options = load_metadata()
     
@@ -109,32 +164,106 @@ if page == "Production Analysis":
         # Status Filter (New)
         selected_statuses = st.sidebar.multiselect("Select Status", status_options, default=status_options)
 
+        # Comparison Mode
+        comparison_mode = st.sidebar.checkbox("Comparison Mode", help="Compare several filter sets side by side.")
+
         # Update Button
         if st.sidebar.button("Update Analysis"):
             with st.spinner("Querying database..."):
                 # Store result in session state
                 st.session_state.data = get_chart_data(start_date, end_date, selected_pools, selected_statuses)
+                # Inclusive of the whole end day (dates are stored with a time component)
+                st.session_state.transitions = get_transition_data(start_date, f"{end_date} 23:59:59", selected_pools)
 
         # --- Main Content ---
 
+        # --- Common Chart Settings ---
+        color_map = {
+            "A": "#28a745",        # Green
+            "AB": "#dc3545",       # Red
+            "IA": "#f88379",       # Light Red / Coral
+            "IA 1 - A": "#ffc107", # Amber/Orange (Warning)
+            "IA 2 - A": "#e83e8c", # Pink
+            "Unknown": "#6c757d"   # Grey
+        }
+        category_orders = {"status": ["A", "IA 1 - A", "IA 2 - A", "IA", "AB"]}
+
+        if comparison_mode:
+            st.subheader("Scenario Comparison")
+
+            num_scenarios = st.number_input("Number of Scenarios", min_value=2, max_value=6, value=2)
+
+            # Each scenario starts from the sidebar filters
+            scenarios = []
+            for i in range(int(num_scenarios)):
+                with st.expander(f"Scenario {i + 1}", expanded=True):
+                    col1, col2, col3 = st.columns([1, 1, 2])
+                    name = col1.text_input("Name", f"Scenario {i + 1}", key=f"cmp_name_{i}")
+                    s_start = col2.date_input("Start Date", start_date, min_value=min_date, max_value=max_date, key=f"cmp_start_{i}")
+                    s_end = col2.date_input("End Date", end_date, min_value=min_date, max_value=max_date, key=f"cmp_end_{i}")
+                    s_pools = col3.multiselect("Pool(s)", pool_options, default=selected_pools, key=f"cmp_pools_{i}")
+                    s_statuses = col3.multiselect("Status", status_options, default=selected_statuses, key=f"cmp_status_{i}")
+                    scenarios.append({"name": name, "start_date": s_start, "end_date": s_end,
+                                      "pools": s_pools, "statuses": s_statuses})
+
+            # Validate every scenario before querying
+            errors = []
+            names = [s['name'] for s in scenarios]
+            if len(set(names)) < len(names):
+                errors.append("Scenario names must be unique.")
+            for s in scenarios:
+                if s['start_date'] > s['end_date']:
+                    errors.append(f"{s['name']}: start date must be before end date.")
+
+            for error in errors:
+                st.error(error)
+
+            if st.button("Run Comparison", disabled=bool(errors)):
+                with st.spinner(f"Querying {len(scenarios)} scenarios..."):
+                    st.session_state.comparison = get_comparison_data(scenarios)
+                    # Remember what was run so edits can be detected
+                    st.session_state.comparison_scenarios = scenarios
+
+            if 'comparison' in st.session_state:
+                df_cmp = st.session_state.comparison
+
+                if st.session_state.get('comparison_scenarios') != scenarios:
+                    st.warning("Scenarios have changed since the last run. Click 'Run Comparison' to refresh these results.")
+
+                if df_cmp.empty:
+                    st.warning("No data found for any scenario.")
+                else:
+                    layout = st.radio("Layout", ["Overlay", "Facet"], horizontal=True)
+
+                    # Per-scenario metrics
+                    summary = df_cmp.groupby('scenario', sort=False).agg(total_oil=('total_oil', 'sum'))
+                    summary['avg_wells'] = df_cmp.groupby(['scenario', 'month'], sort=False)['well_count'].sum().groupby(level=0, sort=False).mean()
+                    for col, (scenario, row) in zip(st.columns(len(summary)), summary.iterrows()):
+                        col.metric(f"{scenario} - Total Oil", f"{row['total_oil']:,.0f} bbls")
+                        col.metric(f"{scenario} - Avg Wells", f"{row['avg_wells']:,.0f}")
+
+                    for y_col, title, y_label in [("well_count", "Well Count", "Number of Wells"),
+                                                  ("total_oil", "Oil Production", "Oil Production (bbls)")]:
+                        if layout == "Overlay":
+                            # One line per scenario, statuses summed
+                            df_total = df_cmp.groupby(['scenario', 'month'], sort=False)[y_col].sum().reset_index()
+                            fig = px.line(df_total, x="month", y=y_col, color="scenario",
+                                          title=f"{title} by Scenario", labels={y_col: y_label, "month": "Date"})
+                        else:
+                            fig = px.area(df_cmp, x="month", y=y_col, color="status", facet_col="scenario",
+                                          color_discrete_map=color_map, category_orders=category_orders,
+                                          title=f"{title} by Status and Scenario", labels={y_col: y_label, "month": "Date"})
+                        st.plotly_chart(fig, use_container_width=True)
+            else:
+                st.info("Set up each scenario and click 'Run Comparison'.")
+
         # Check if data exists in session state
-        if 'data' in st.session_state:
+        elif 'data' in st.session_state:
             df_chart = st.session_state.data
             
             if df_chart.empty:
                 st.warning("No data found for the selected filters.")
             else:
-                # --- Common Chart Settings ---
-                color_map = {
-                    "A": "#28a745",        # Green
-                    "AB": "#dc3545",       # Red
-                    "IA": "#f88379",       # Light Red / Coral
-                    "IA 1 - A": "#ffc107", # Amber/Orange (Warning)
-                    "IA 2 - A": "#e83e8c", # Pink
-                    "Unknown": "#6c757d"   # Grey
-                }
-                category_orders = {"status": ["A", "IA 1 - A", "IA 2 - A", "IA", "AB"]}
-
                 # --- Chart Helper Function ---
                 def render_chart(df, y_col, title, y_label):
                     if chart_type == "Stacked Bar":
@@ -165,11 +294,130 @@ if page == "Production Analysis":
                 # 3. Production Chart
                 st.plotly_chart(render_chart(df_chart, "total_oil", "Oil Production by Status", "Oil Production (bbls)"), use_container_width=True)
 
+            # 4. Status Transitions
+            st.subheader("Status Transitions")
+            df_tr = st.session_state.get('transitions')
+
+            if df_tr is None:
+                st.info("No transitions table found. Run `add_status_column.py` to build it.")
+            elif df_tr.empty:
+                st.warning("No status transitions found for the selected filters.")
+            else:
+                event_labels = {
+                    "shut_ins": "Shut-ins",
+                    "reactivations": "Reactivations",
+                    "abandonments": "Abandonments"
+                }
+
+                col1, col2, col3 = st.columns(3)
+                col1.metric("Shut-ins", f"{df_tr['shut_ins'].sum():,.0f}")
+                col2.metric("Reactivations", f"{df_tr['reactivations'].sum():,.0f}")
+                col3.metric("Abandonments", f"{df_tr['abandonments'].sum():,.0f}")
+
+                event = st.radio("Event", list(event_labels.keys()), format_func=event_labels.get, horizontal=True)
+                fig_tr = px.bar(df_tr, x="month", y=event, color="pool",
+                                title=f"Monthly {event_labels[event]} by Pool",
+                                labels={event: "Number of Wells", "month": "Date"})
+                st.plotly_chart(fig_tr, use_container_width=True)
+
         else:
             st.info("👈 Select filters and click 'Update Analysis' in the sidebar to load data.")
 
+elif page == "Anomalies":
+    st.header("⚠️ Production Anomalies")
+
+    @st.cache_data
+    def load_anomaly_metadata(db_signature):
+        """Load filter options from the anomalies table; db_signature only serves as a cache key."""
+        conn = sqlite3.connect(DB_NAME)
+        try:
+            dates = pd.read_sql("SELECT MIN(date) as min_date, MAX(date) as max_date FROM production_anomalies", conn)
+            min_date = pd.to_datetime(dates['min_date'][0])
+            max_date = pd.to_datetime(dates['max_date'][0])
+
+            pools = pd.read_sql("SELECT DISTINCT pool FROM production_anomalies ORDER BY pool", conn)
+            types = pd.read_sql("SELECT DISTINCT anomaly_type FROM production_anomalies ORDER BY anomaly_type", conn)
+        except (pd.errors.DatabaseError, sqlite3.OperationalError):
+            return None, None, [], []
+        finally:
+            conn.close()
+
+        return min_date, max_date, pools['pool'].tolist(), types['anomaly_type'].tolist()
+
+    def get_anomalies(start_date, end_date, selected_pools, selected_types):
+        conn = sqlite3.connect(DB_NAME)
+
+        params = [start_date, end_date]
+
+        pool_clause = ""
+        if selected_pools:
+            placeholders = ",".join("?" * len(selected_pools))
+            pool_clause = f"AND pool IN ({placeholders})"
+            params.extend(selected_pools)
+
+        type_clause = ""
+        if selected_types:
+            placeholders = ",".join("?" * len(selected_types))
+            type_clause = f"AND anomaly_type IN ({placeholders})"
+            params.extend(selected_types)
+
+        query = f"""
+        SELECT 
+            date(date) as date, file_no, api_no, pool, anomaly_type, value, baseline, score
+        FROM production_anomalies
+        WHERE date >= ? AND date <= ?
+        {pool_clause}
+        {type_clause}
+        ORDER BY date DESC
+        """
+
+        df = pd.read_sql(query, conn, params=params)
+        conn.close()
+        return df
+
+    # Keyed on the DB file so a new scan (or the first one) shows up without clearing the cache
+    min_date, max_date, pool_options, type_options = load_anomaly_metadata(spatial_join.file_signature(DB_NAME))
+
+    if not min_date:
+        st.info("No anomalies table found.")
+        st.markdown("**Action Required**: Run `detect_anomalies.py` to scan `production_data` for suspicious reports.")
+    else:
+        col1, col2, col3, col4 = st.columns(4)
+        start_date = col1.date_input("Start Date", min_date, min_value=min_date, max_value=max_date)
+        end_date = col2.date_input("End Date", max_date, min_value=min_date, max_value=max_date)
+        selected_types = col3.multiselect("Anomaly Type", type_options, default=type_options)
+        selected_pools = col4.multiselect("Pool(s)", pool_options)
+
+        # Inclusive of the whole end day (dates are stored with a time component)
+        df_an = get_anomalies(start_date, f"{end_date} 23:59:59", selected_pools, selected_types)
+
+        if df_an.empty:
+            st.warning("No anomalies found for the selected filters.")
+        else:
+            counts = df_an['anomaly_type'].value_counts()
+            for col, (anomaly_type, count) in zip(st.columns(len(counts)), counts.items()):
+                col.metric(anomaly_type, f"{count:,}")
+
+            df_an['month'] = df_an['date'].str[:7]
+            monthly = df_an.groupby(['month', 'anomaly_type']).size().reset_index(name='count')
+            st.plotly_chart(px.bar(monthly, x="month", y="count", color="anomaly_type",
+                                   title="Anomalies per Month", labels={"count": "Flagged Reports", "month": "Date"}),
+                            use_container_width=True)
+
+            st.dataframe(df_an.drop(columns='month'), use_container_width=True)
+
 elif page == "Map Explorer":
     st.header("🗺️ Geospatial Explorer")
+
+    @st.cache_data
+    def load_polygon_production(layer, layer_signature, wells_signature, db_signature):
+        """Per-polygon production for a layer; the signatures only serve as cache keys."""
+        # st_folium reruns the script on every pan/zoom, so don't re-aggregate unless something changed
+        conn = sqlite3.connect(DB_NAME)
+        try:
+            return spatial_join.get_polygon_production(conn, layer)
+        finally:
+            conn.close()
     
     # Ensure maps directory exists
     if not os.path.exists(MAPS_FOLDER):
@@ -197,6 +445,24 @@ elif page == "Map Explorer":
                     if gdf.crs and gdf.crs.to_string() != "EPSG:4326":
                          gdf = gdf.to_crs(epsg=4326)
 
+                    # Attach polygon-level production through the cached well -> polygon lookup
+                    if os.path.exists(spatial_join.WELLS_FILE) and selected_map in spatial_join.list_layers():
+                        conn = sqlite3.connect(DB_NAME)
+                        try:
+                            if spatial_join.ensure_join(conn, selected_map):
+                                st.toast(f"Rebuilt well lookup for {selected_map}")
+                        finally:
+                            conn.close()
+                        # Signatures are taken after ensure_join so a rebuilt lookup gets a new cache key
+                        prod = load_polygon_production(
+                            selected_map,
+                            spatial_join.file_signature(file_path),
+                            spatial_join.file_signature(spatial_join.WELLS_FILE),
+                            spatial_join.file_signature(DB_NAME),
+                        )
+                        # polygon_id is the row position in the layer file, which is gdf's index
+                        gdf = gdf.join(prod.set_index('polygon_id'), rsuffix='_prod')
+
                     # Inspect columns to find numeric candidates for coloring
                     numeric_cols = gdf.select_dtypes(include=['number']).columns.tolist()
                     
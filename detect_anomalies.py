@@ -0,0 +1,227 @@
+import pandas as pd
+import numpy as np
+import sqlite3
+import argparse
+import warnings
+from numpy.lib.stride_tricks import sliding_window_view
+
+DB_NAME = "production.db"
+ANOMALIES_TABLE = "production_anomalies"
+SCAN_LOG_TABLE = "anomaly_scan_log"
+
+# Trailing window used for the robust baseline of each well, in reported rows
+# (months the well has a report for, so gaps in reporting are skipped over)
+WINDOW = 12
+# Minimum reported rows of history before a well's baseline is trusted
+MIN_HISTORY = 3
+# Rows per NumPy batch; bounds the (rows x WINDOW) window matrix in memory
+CHUNK_SIZE = 500_000
+
+# Thresholds
+SPIKE_RATIO = 10        # oil > 10x the trailing median
+ROBUST_Z = 5            # and more than 5 robust standard deviations above it
+WATER_CUT_JUMP = 0.3    # absolute change in water cut vs the trailing median
+
+# MAD -> standard deviation for normally distributed data
+MAD_SCALE = 1.4826
+
+def rolling_median_mad(values, pos, window=WINDOW, chunk_size=CHUNK_SIZE):
+    """
+    Trailing median and MAD of the previous `window` rows of the same well, for every row.
+    values must be sorted by well then date; pos is each row's position within its well.
+    """
+    n = len(values)
+    padded = np.concatenate([np.full(window, np.nan), values.astype(float)])
+    # windows[i] = values[i - window : i] (a view, nothing is copied yet)
+    windows = sliding_window_view(padded, window)[:n]
+
+    # Column j of a window is `window - j` rows back; anything further back than
+    # the row's position within its well belongs to the previous well
+    lag = window - np.arange(window)
+
+    median = np.full(n, np.nan)
+    mad = np.full(n, np.nan)
+    with warnings.catch_warnings():
+        # Rows with no usable history produce all-NaN windows
+        warnings.simplefilter("ignore", RuntimeWarning)
+        for start in range(0, n, chunk_size):
+            stop = min(start + chunk_size, n)
+            w = np.where(lag[None, :] <= pos[start:stop, None], windows[start:stop], np.nan)
+            med = np.nanmedian(w, axis=1)
+            median[start:stop] = med
+            mad[start:stop] = np.nanmedian(np.abs(w - med[:, None]), axis=1)
+
+    too_short = pos < MIN_HISTORY
+    median[too_short] = np.nan
+    mad[too_short] = np.nan
+    return median, mad
+
+def robust_z(values, median, mad):
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return (values - median) / (MAD_SCALE * mad)
+
+def find_anomalies(df):
+    """Flag suspicious rows. Returns one row per (record, anomaly_type)."""
+    df = df.sort_values(by=['file_no', 'pool', 'date']).reset_index(drop=True)
+    pos = df.groupby(['file_no', 'pool'], dropna=False).cumcount().to_numpy()
+
+    oil = df['bbls_oil'].to_numpy(dtype=float)
+    water = df['bbls_water'].to_numpy(dtype=float)
+
+    found = []
+
+    def flag(mask, anomaly_type, value, baseline=np.nan, score=np.nan):
+        mask = np.asarray(mask) & ~np.isnan(value)
+        if not mask.any():
+            return
+        hits = df.loc[mask, ['file_no', 'api_no', 'pool', 'date']].copy()
+        hits['anomaly_type'] = anomaly_type
+        hits['value'] = value[mask]
+        hits['baseline'] = np.broadcast_to(baseline, value.shape)[mask]
+        hits['score'] = np.broadcast_to(score, value.shape)[mask]
+        found.append(hits)
+
+    # 1. Negative volumes
+    for col in ['bbls_oil', 'bbls_water', 'mcf_gas']:
+        values = df[col].to_numpy(dtype=float)
+        flag(values < 0, f'negative_{col}', values)
+
+    # 2. Days produced longer than the month
+    days = df['days_produced'].to_numpy(dtype=float)
+    days_in_month = df['date'].dt.days_in_month.to_numpy(dtype=float)
+    flag(days > days_in_month, 'days_produced_over_month', days, days_in_month)
+
+    # 3. Oil spikes over the well's trailing trend
+    oil_med, oil_mad = rolling_median_mad(oil, pos)
+    oil_z = robust_z(oil, oil_med, oil_mad)
+    flag((oil_med > 0) & (oil > SPIKE_RATIO * oil_med) & (oil_z > ROBUST_Z),
+         'oil_spike', oil, oil_med, oil_z)
+
+    # 4. Water cut jumps
+    with np.errstate(divide='ignore', invalid='ignore'):
+        total_liquid = oil + water
+        valid = (oil >= 0) & (water >= 0) & (total_liquid > 0)
+        water_cut = np.where(valid, water / total_liquid, np.nan)
+    wc_med, wc_mad = rolling_median_mad(water_cut, pos)
+    flag(np.abs(water_cut - wc_med) > WATER_CUT_JUMP,
+         'water_cut_jump', water_cut, wc_med, robust_z(water_cut, wc_med, wc_mad))
+
+    if not found:
+        return pd.DataFrame(columns=['file_no', 'api_no', 'pool', 'date',
+                                     'anomaly_type', 'value', 'baseline', 'score'])
+    return pd.concat(found, ignore_index=True)
+
+# Per-month fingerprint compared between runs
+SUMMARY_COLUMNS = ['row_count', 'oil', 'water', 'gas', 'days']
+
+def get_month_summary(conn):
+    """Row count and volume totals per report month."""
+    return pd.read_sql("""
+    SELECT 
+        strftime('%Y-%m', date) as month,
+        COUNT(*) as row_count,
+        TOTAL(bbls_oil) as oil,
+        TOTAL(bbls_water) as water,
+        TOTAL(mcf_gas) as gas,
+        TOTAL(days_produced) as days
+    FROM production_data
+    WHERE date IS NOT NULL
+    GROUP BY 1
+    """, conn)
+
+def get_scanned_summary(conn):
+    try:
+        return pd.read_sql(f"SELECT month, {', '.join(SUMMARY_COLUMNS)} FROM {SCAN_LOG_TABLE}", conn)
+    except (pd.errors.DatabaseError, sqlite3.OperationalError):
+        return None
+
+def first_changed_month(current, scanned):
+    """
+    Earliest month whose row count or volume totals differ from the last scan. This
+    catches new months, topped-up partial months, late reports for old months and
+    reports amended in place.
+    """
+    merged = current.merge(scanned, on='month', how='outer', suffixes=('', '_scanned'))
+    changed = pd.Series(False, index=merged.index)
+    for col in SUMMARY_COLUMNS:
+        # Tolerance because the summation order can differ after the table is rebuilt
+        changed |= ~np.isclose(merged[col], merged[f'{col}_scanned'])
+    changed = merged[changed]
+    return changed['month'].min() if not changed.empty else None
+
+def detect_anomalies(full=False):
+    print(f"Connecting to {DB_NAME}...")
+    conn = sqlite3.connect(DB_NAME)
+
+    current = get_month_summary(conn)
+    scanned = None if full else get_scanned_summary(conn)
+
+    since = None
+    if scanned is not None:
+        changed_month = first_changed_month(current, scanned)
+        if changed_month is None:
+            conn.close()
+            print("--- No changes since the last scan ---")
+            return
+        since = pd.Timestamp(f"{changed_month}-01")
+
+    columns = "file_no, api_no, pool, date, bbls_oil, bbls_water, mcf_gas, days_produced"
+    if since is None:
+        print("Running full anomaly scan...")
+        df = pd.read_sql(f"SELECT {columns} FROM production_data", conn)
+    else:
+        # Every month from the first changed one onwards is rescanned (later baselines
+        # depend on it). Each well also needs its last WINDOW rows before that month,
+        # however far back they go, so baselines match a full scan.
+        print(f"Rescanning from {since:%Y-%m} (plus the last {WINDOW} reports of each well)...")
+        df = pd.read_sql(f"""
+        SELECT {columns} FROM production_data WHERE date >= ?
+        UNION ALL
+        SELECT {columns} FROM (
+            SELECT {columns},
+                ROW_NUMBER() OVER (PARTITION BY file_no, pool ORDER BY date DESC) as rn
+            FROM production_data
+            WHERE date < ?
+        )
+        WHERE rn <= ?
+        """, conn, params=(str(since), str(since), WINDOW))
+
+    print(f"Loaded {len(df)} rows.")
+
+    df['date'] = pd.to_datetime(df['date'])
+    anomalies = find_anomalies(df)
+    if since is not None:
+        anomalies = anomalies[anomalies['date'] >= since]
+
+    print(f"Found {len(anomalies)} anomalies.")
+    if not anomalies.empty:
+        print(anomalies['anomaly_type'].value_counts().to_string())
+
+    print("Writing to database...")
+    cursor = conn.cursor()
+    if since is None:
+        anomalies.to_sql(ANOMALIES_TABLE, conn, if_exists='replace', index=False)
+    else:
+        # Replace whatever was flagged for the rescanned months
+        cursor.execute(f"DELETE FROM {ANOMALIES_TABLE} WHERE date >= ?", (str(since),))
+        anomalies.to_sql(ANOMALIES_TABLE, conn, if_exists='append', index=False)
+
+    cursor.execute(f"CREATE INDEX IF NOT EXISTS idx_an_date ON {ANOMALIES_TABLE} (date)")
+    cursor.execute(f"CREATE INDEX IF NOT EXISTS idx_an_pool_date ON {ANOMALIES_TABLE} (pool, date)")
+    cursor.execute(f"CREATE INDEX IF NOT EXISTS idx_an_type ON {ANOMALIES_TABLE} (anomaly_type)")
+    cursor.execute(f"CREATE INDEX IF NOT EXISTS idx_an_api_no ON {ANOMALIES_TABLE} (api_no)")
+
+    # Snapshot the per-month summary so the next run can tell what changed since
+    current['scanned_at'] = pd.Timestamp.now().strftime('%Y-%m-%d %H:%M:%S')
+    current.to_sql(SCAN_LOG_TABLE, conn, if_exists='replace', index=False)
+    conn.commit()
+    conn.close()
+
+    print("--- Anomaly Scan Complete ---")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Flag suspicious production reports.")
+    parser.add_argument("--full", action="store_true",
+                        help="Rescan every month instead of only those that changed since the last run.")
+    args = parser.parse_args()
+    detect_anomalies(full=args.full)
@@ -0,0 +1,154 @@
+import pandas as pd
+import geopandas as gpd
+import sqlite3
+import os
+from shapely import STRtree
+
+DB_NAME = "production.db"
+MAPS_FOLDER = "maps"
+# Point layer of well surface locations with an 'api_no' column
+WELLS_FILE = os.path.join(MAPS_FOLDER, "wells.gpkg")
+
+LOOKUP_TABLE = "well_polygons"
+LOG_TABLE = "spatial_join_log"
+
+def file_signature(path):
+    """mtime/size pair used to detect that a layer file has changed."""
+    stat = os.stat(path)
+    return f"{stat.st_mtime_ns}:{stat.st_size}"
+
+def list_layers():
+    """Polygon layers in the maps folder (the wells layer itself is excluded)."""
+    if not os.path.exists(MAPS_FOLDER):
+        return []
+    return [f for f in os.listdir(MAPS_FOLDER)
+            if f.endswith(('.gpkg', '.shp', '.geojson'))
+            and os.path.join(MAPS_FOLDER, f) != WELLS_FILE]
+
+def init_tables(conn):
+    cursor = conn.cursor()
+    cursor.execute(f"""
+    CREATE TABLE IF NOT EXISTS {LOOKUP_TABLE} (
+        layer TEXT,
+        api_no INTEGER,
+        polygon_id INTEGER
+    )
+    """)
+    cursor.execute(f"CREATE INDEX IF NOT EXISTS idx_wp_layer_api ON {LOOKUP_TABLE} (layer, api_no)")
+    cursor.execute(f"CREATE INDEX IF NOT EXISTS idx_wp_layer_poly ON {LOOKUP_TABLE} (layer, polygon_id)")
+    cursor.execute(f"""
+    CREATE TABLE IF NOT EXISTS {LOG_TABLE} (
+        layer TEXT PRIMARY KEY,
+        layer_signature TEXT,
+        wells_signature TEXT,
+        built_at TEXT
+    )
+    """)
+    conn.commit()
+
+def load_wells():
+    wells = gpd.read_file(WELLS_FILE)
+    # Match the numeric api_no stored in production_data
+    wells['api_no'] = pd.to_numeric(wells['api_no'], errors='coerce')
+    wells = wells.dropna(subset=['api_no']).drop_duplicates(subset='api_no')
+    return wells[['api_no', 'geometry']]
+
+def build_join(layer, wells=None):
+    """
+    Map each well to the polygon of `layer` that contains it.
+    polygon_id is the row position of the polygon in the layer file as read by geopandas.
+    """
+    polygons = gpd.read_file(os.path.join(MAPS_FOLDER, layer))
+    if wells is None:
+        wells = load_wells()
+
+    if wells.crs and polygons.crs and wells.crs != polygons.crs:
+        wells = wells.to_crs(polygons.crs)
+
+    # One tree over the polygons, queried with every well at once.
+    # covered_by (not within) so wells surveyed exactly on a unit or lease line still match.
+    tree = STRtree(polygons.geometry.values)
+    well_idx, poly_idx = tree.query(wells.geometry.values, predicate='covered_by')
+
+    lookup = pd.DataFrame({
+        'layer': layer,
+        'api_no': wells['api_no'].to_numpy()[well_idx].astype('int64'),
+        'polygon_id': poly_idx,
+    })
+    # Shared edges or overlapping polygons: keep the first one so each well counts once per layer
+    lookup = lookup.sort_values('polygon_id').drop_duplicates(subset='api_no')
+    return lookup
+
+def ensure_join(conn, layer, wells=None):
+    """
+    Build the lookup for `layer` unless it is cached and neither the layer
+    nor the wells file has changed since. Returns True if it was rebuilt.
+    """
+    init_tables(conn)
+
+    layer_sig = file_signature(os.path.join(MAPS_FOLDER, layer))
+    wells_sig = file_signature(WELLS_FILE)
+
+    cached = conn.execute(f"SELECT layer_signature, wells_signature FROM {LOG_TABLE} WHERE layer = ?",
+                          (layer,)).fetchone()
+    if cached == (layer_sig, wells_sig):
+        return False
+
+    lookup = build_join(layer, wells)
+
+    cursor = conn.cursor()
+    cursor.execute(f"DELETE FROM {LOOKUP_TABLE} WHERE layer = ?", (layer,))
+    lookup.to_sql(LOOKUP_TABLE, conn, if_exists='append', index=False)
+    cursor.execute(f"INSERT OR REPLACE INTO {LOG_TABLE} VALUES (?, ?, ?, datetime('now'))",
+                   (layer, layer_sig, wells_sig))
+    conn.commit()
+    return True
+
+def get_polygon_production(conn, layer, start_date=None, end_date=None):
+    """Production aggregated per polygon of `layer`, via the lookup table."""
+    params = [layer]
+
+    date_clause = ""
+    if start_date is not None and end_date is not None:
+        date_clause = "AND p.date >= ? AND p.date <= ?"
+        params.extend([start_date, end_date])
+
+    query = f"""
+    SELECT
+        wp.polygon_id,
+        COUNT(DISTINCT p.api_no) as well_count,
+        SUM(p.bbls_oil) as total_oil,
+        SUM(p.bbls_water) as total_water,
+        SUM(p.mcf_gas) as total_gas
+    FROM {LOOKUP_TABLE} wp
+    JOIN production_data p ON p.api_no = wp.api_no
+    WHERE wp.layer = ?
+    {date_clause}
+    GROUP BY wp.polygon_id
+    """
+    return pd.read_sql(query, conn, params=params)
+
+def build_all():
+    print("--- Starting Spatial Join ---")
+
+    if not os.path.exists(WELLS_FILE):
+        print(f"Error: Well locations not found at {WELLS_FILE}")
+        return
+
+    print(f"Reading {os.path.basename(WELLS_FILE)}...")
+    wells = load_wells()
+    print(f"  - Wells: {len(wells)}")
+
+    conn = sqlite3.connect(DB_NAME)
+    for layer in list_layers():
+        if ensure_join(conn, layer, wells):
+            count = conn.execute(f"SELECT COUNT(*) FROM {LOOKUP_TABLE} WHERE layer = ?", (layer,)).fetchone()[0]
+            print(f"  - {layer}: {count} wells matched")
+        else:
+            print(f"  - {layer}: up to date")
+    conn.close()
+
+    print("--- Spatial Join Complete ---")
+
+if __name__ == "__main__":
+    build_all()
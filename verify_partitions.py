@@ -0,0 +1,81 @@
+import sqlite3
+import pandas as pd
+import numpy as np
+import os
+import shutil
+import tempfile
+from add_status_column import add_status_column, compute_status, build_transitions, TRANSITIONS_TABLE
+
+def make_sample_data():
+    """Small synthetic production table, including rows with a NULL file_no or pool."""
+    rng = np.random.default_rng(0)
+    rows = []
+    for file_no in list(range(40)) + [None]:
+        for pool in ['X', None] if file_no in (0, None) else ['X']:
+            for date in pd.date_range('2020-01-01', periods=int(rng.integers(3, 15)), freq='MS'):
+                rows.append((file_no, 1000 + (file_no or 0), pool, date, float(rng.choice([0, 0, 5, 10]))))
+    df = pd.DataFrame(rows, columns=['file_no', 'api_no', 'pool', 'date', 'bbls_oil'])
+
+    # Numeric column that is NULL only for the lowest file_no values (the first partition),
+    # like the Excel-only columns on historical rows
+    df['mcf_flared'] = np.where(df['file_no'].fillna(0) < 10, np.nan, df['bbls_oil'] * 2)
+    return df
+
+def verify_partitions():
+    work_dir = tempfile.mkdtemp(prefix="verify_partitions_")
+    db_name = os.path.join(work_dir, "sample.db")
+
+    try:
+        df = make_sample_data()
+        conn = sqlite3.connect(db_name)
+        df.to_sql('production_data', conn, index=False)
+        conn.close()
+
+        print("--- Running partitioned status computation ---")
+        add_status_column(db_name, num_partitions=4, num_workers=2)
+
+        # Reference: the same logic over the whole frame in one process
+        expected = compute_status(df.copy())
+        expected_tr = build_transitions(expected)
+
+        conn = sqlite3.connect(db_name)
+        actual = pd.read_sql("SELECT * FROM production_data", conn)
+        actual_tr = pd.read_sql(f"SELECT * FROM {TRANSITIONS_TABLE}", conn)
+        flared_types = pd.read_sql("""
+        SELECT typeof(mcf_flared) as type, count(*) as count
+        FROM production_data
+        WHERE mcf_flared IS NOT NULL
+        GROUP BY 1
+        """, conn)
+        conn.close()
+
+        print("\n--- Row Count Verification ---")
+        null_rows = actual['file_no'].isna().sum() + actual['pool'].isna().sum()
+        print(f"Rows: {len(actual)} (expected {len(df)}), rows with a NULL key: {null_rows}")
+
+        def normalize(frame, cols):
+            frame = frame[cols].copy()
+            frame['date'] = pd.to_datetime(frame['date'])
+            return frame.sort_values(cols, na_position='first').reset_index(drop=True)
+
+        status_cols = ['file_no', 'pool', 'date', 'status', 'no_prod_1m', 'no_prod_2m']
+        tr_cols = ['file_no', 'pool', 'date', 'from_status', 'to_status', 'run_length']
+        status_ok = normalize(actual, status_cols).equals(normalize(expected, status_cols))
+        tr_ok = normalize(actual_tr, tr_cols).equals(normalize(expected_tr, tr_cols))
+
+        print("\n--- Status Verification ---")
+        print("Success: statuses match single-process run." if status_ok else "Error: statuses differ!")
+        print("Success: transitions match single-process run." if tr_ok else "Error: transitions differ!")
+
+        print("\n--- Column Type Verification ---")
+        print(flared_types.to_string(index=False))
+        types_ok = flared_types['type'].tolist() == ['real']
+        print("Success: mcf_flared kept its numeric type." if types_ok else "Error: mcf_flared not stored as real!")
+
+        if len(actual) != len(df) or null_rows == 0 or not (status_ok and tr_ok and types_ok):
+            raise SystemExit(1)
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+if __name__ == "__main__":
+    verify_partitions()